@@ -1,26 +1,34 @@
+from dotenv import load_dotenv
+
+# Load environment variables before importing modules that read them
+load_dotenv()
+
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from qa_engine import QAEngine
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import Optional
+from qa_engine import AnswerError, QAEngine
 from vector_store import VectorStore
 from document_processor import DocumentProcessor
-from dotenv import load_dotenv
+from semantic_cache import SemanticCache
+import asyncio
+import msgspec
+import orjson
 import os
+import threading
 import time
 import logging
 
-# Load environment variables
-load_dotenv()
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging once for the whole process
+if not logging.getLogger().handlers:
+    logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Personal Chat API",
     description="A document-based Q&A system using OpenAI's API",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -37,44 +45,83 @@ vector_store = None
 doc_processor = None
 qa_engine = None
 
+# Answers to previous questions, looked up by query-embedding similarity
+answer_cache = SemanticCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "1024")),
+    normalize=False  # embed_query already returns unit vectors
+)
+
+components_lock = threading.Lock()
+
 def get_components():
     """Initialize components if not already initialized"""
     global vector_store, doc_processor, qa_engine
-    if vector_store is None:
-        vector_store = VectorStore()
-        doc_processor = DocumentProcessor()
-        qa_engine = QAEngine()
+    if qa_engine is None:
+        with components_lock:
+            if qa_engine is None:
+                vector_store = VectorStore()
+                doc_processor = DocumentProcessor()
+                qa_engine = QAEngine()
     return vector_store, doc_processor, qa_engine
 
+# Documents are indexed in the background at startup; /ask answers 503 until they are ready
+indexing_task: Optional[asyncio.Task] = None
+
+async def index_documents() -> int:
+    """Process and index the Documents folder off the event loop, returning the chunk count"""
+    vector_store, doc_processor, qa_engine = get_components()
+    chunks, metadatas = await doc_processor.process_documents()
+    if chunks:
+        await asyncio.to_thread(vector_store.add_documents, chunks, metadatas)
+    return len(chunks)
+
+async def index_documents_at_startup():
+    """Index documents without blocking startup"""
+    try:
+        logger.info("Processing documents at startup...")
+        chunk_count = await index_documents()
+        if chunk_count:
+            logger.info(f"Startup: Processed {chunk_count} document chunks")
+        else:
+            logger.warning("No documents found in the Documents folder")
+    except Exception as e:
+        logger.error(f"Error processing documents at startup: {str(e)}")
+
+async def reindex_documents() -> int:
+    """Clear the collection and index the Documents folder again, returning the chunk count"""
+    vector_store, doc_processor, qa_engine = get_components()
+    vector_store.clear()
+    answer_cache.clear()
+    return await index_documents()
+
+def is_indexing() -> bool:
+    """Returns True while documents are being indexed at startup or by /update"""
+    return indexing_task is not None and not indexing_task.done()
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize components and process documents at startup"""
+    global indexing_task
     logger.info("Initializing components at startup...")
     try:
-        # Just initialize components, don't process documents automatically
+        # Load models during boot rather than on the first request
         vector_store, doc_processor, qa_engine = get_components()
-        logger.info("Components initialized, ready for requests!")
-        
-        # Uncomment the following lines if you want automatic document processing at startup
-        # This is commented out to prevent container crashes on startup
-        # if vector_store.is_empty():
-        #     logger.info("Processing documents at startup...")
-        #     chunks, metadatas = doc_processor.process_documents()
-        #     if chunks:
-        #         vector_store.add_documents(chunks, metadatas)
-        #         logger.info(f"Startup: Processed {len(chunks)} document chunks")
-        #     else:
-        #         logger.warning("No documents found in the Documents folder")
-        # else:
-        #     logger.info("Vector store already contains data")
-        
+        logger.info("Components initialized")
+
+        if not vector_store._ready:
+            # Index in the background so /health responds while embeddings populate
+            indexing_task = asyncio.create_task(index_documents_at_startup())
+        else:
+            logger.info("Vector store already contains data")
+
         logger.info("Startup initialization complete!")
     except Exception as e:
         logger.error(f"Error during startup initialization: {str(e)}")
         # Don't fail startup, let the app handle it later
         pass
 
-class Question(BaseModel):
+class Question(msgspec.Struct):
     text: str
 
 @app.middleware("http")
@@ -93,20 +140,29 @@ async def health_check():
 @app.get("/warmup")
 async def warmup():
     """Warmup endpoint to initialize components manually"""
+    global indexing_task
     try:
         logger.info("Manual warmup requested...")
         vector_store, doc_processor, qa_engine = get_components()
-        
+
+        if is_indexing():
+            return {
+                "status": "indexing",
+                "message": "Documents are being processed in the background",
+                "ready": False
+            }
+
         # Process documents if the collection is empty
         if vector_store.is_empty():
             logger.info("Processing documents during warmup...")
-            chunks, metadatas = doc_processor.process_documents()
-            if chunks:
-                vector_store.add_documents(chunks, metadatas)
-                logger.info(f"Warmup: Processed {len(chunks)} document chunks")
+            # Tracked and shielded like /update, so other requests see the indexing phase
+            indexing_task = asyncio.create_task(index_documents())
+            chunk_count = await asyncio.shield(indexing_task)
+            if chunk_count:
+                logger.info(f"Warmup: Processed {chunk_count} document chunks")
                 return {
                     "status": "warmup_complete",
-                    "message": f"Processed {len(chunks)} document chunks",
+                    "message": f"Processed {chunk_count} document chunks",
                     "ready": True
                 }
             else:
@@ -144,9 +200,42 @@ async def read_root():
         }
     }
 
+def sse_event(payload: dict) -> bytes:
+    """Encode a payload as a server-sent event frame"""
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+async def stream_answer(qa_engine: QAEngine, question: str, context: str, query_embedding, start_time: float):
+    """Yield the answer as server-sent events and cache it once complete"""
+    parts = []
+    failed = False
+    async for token in qa_engine.aget_answer_stream(question, context):
+        if isinstance(token, AnswerError):
+            failed = True
+            yield sse_event({"error": str(token)})
+            break
+        parts.append(token)
+        yield sse_event({"token": token})
+
+    # A stream that failed partway leaves a truncated answer, which must not be cached
+    if context and not failed:
+        answer_cache.put(query_embedding, "".join(parts))
+
+    process_time = time.time() - start_time
+    logger.info(f"Question streamed in {process_time:.2f} seconds")
+    yield sse_event({"done": True, "processing_time": f"{process_time:.2f} seconds"})
+
 @app.post("/ask")
-async def ask_question(question: Question):
-    """Ask a question and get an answer based on the documents"""
+async def ask_question(request: Request):
+    """Ask a question and get an answer based on the documents.
+
+    Expects a JSON body of the form {"text": "..."}. Clients sending
+    `Accept: text/event-stream` receive the answer as it is generated.
+    """
+    try:
+        question = msgspec.json.decode(await request.body(), type=Question)
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
     try:
         start_time = time.time()
         logger.info(f"Processing question: {question.text}")
@@ -154,21 +243,41 @@ async def ask_question(question: Question):
         # Get initialized components
         vector_store, doc_processor, qa_engine = get_components()
 
-        # Process documents if the collection is empty
-        if vector_store.is_empty():
-            logger.info("Vector store is empty, processing documents...")
-            chunks, metadatas = doc_processor.process_documents()
-            if not chunks:
-                raise HTTPException(status_code=404, detail="No documents found in the Documents folder.")
-            vector_store.add_documents(chunks, metadatas)
-            logger.info(f"Added {len(chunks)} document chunks")
-
-        # Search for relevant chunks
-        search_results = vector_store.search(question.text, n_results=3)
-        
-        # Prepare context and get answer
-        context = qa_engine.prepare_context(search_results)
-        answer = qa_engine.get_answer(question.text, context)
+        if not vector_store._ready:
+            if is_indexing():
+                raise HTTPException(
+                    status_code=503,
+                    detail="Documents are still being processed. Please try again shortly.",
+                    headers={"Retry-After": "5"}
+                )
+            raise HTTPException(status_code=404, detail="No documents indexed. Use /update to process the Documents folder.")
+
+        # Serve semantically equivalent questions from the answer cache
+        query_embedding = vector_store.embed_query(question.text)
+        answer = answer_cache.get(query_embedding)
+        streaming = "text/event-stream" in request.headers.get("accept", "")
+        if answer is None:
+            # Search for relevant chunks
+            search_results = vector_store.search(question.text, n_results=3, query_embedding=query_embedding)
+
+            # Prepare context and get answer
+            context = qa_engine.prepare_context(search_results)
+            if streaming:
+                return StreamingResponse(
+                    stream_answer(qa_engine, question.text, context, query_embedding, start_time),
+                    media_type="text/event-stream"
+                )
+            answer = await qa_engine.aget_answer(question.text, context)
+            # An empty context means nothing matched or the search failed; don't pin that answer
+            if context and not isinstance(answer, AnswerError):
+                answer_cache.put(query_embedding, answer)
+        elif streaming:
+            process_time = time.time() - start_time
+            frames = [
+                sse_event({"token": answer}),
+                sse_event({"done": True, "processing_time": f"{process_time:.2f} seconds"})
+            ]
+            return StreamingResponse(iter(frames), media_type="text/event-stream")
         
         process_time = time.time() - start_time
         logger.info(f"Question processed in {process_time:.2f} seconds")
@@ -177,6 +286,8 @@ async def ask_question(question: Question):
             "answer": answer,
             "processing_time": f"{process_time:.2f} seconds"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing question: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -184,22 +295,28 @@ async def ask_question(question: Question):
 @app.post("/update")
 async def update_documents():
     """Update the document collection"""
+    global indexing_task
+    # Clearing while another indexing run is still inserting would interleave the two
+    if is_indexing():
+        raise HTTPException(
+            status_code=409,
+            detail="Documents are already being processed. Please try again shortly.",
+            headers={"Retry-After": "5"}
+        )
     try:
         start_time = time.time()
         logger.info("Starting document update")
-        
-        # Get initialized components
-        vector_store, doc_processor, qa_engine = get_components()
-        
-        vector_store.clear()
-        chunks, metadatas = doc_processor.process_documents()
-        vector_store.add_documents(chunks, metadatas)
+
+        # Tracked like startup indexing, so /ask answers 503 rather than 404 meanwhile;
+        # shielded so a disconnecting client can't abort the update halfway through
+        indexing_task = asyncio.create_task(reindex_documents())
+        chunk_count = await asyncio.shield(indexing_task)
         
         process_time = time.time() - start_time
         logger.info(f"Documents updated in {process_time:.2f} seconds")
         
         return {
-            "message": f"Updated with {len(chunks)} document chunks.",
+            "message": f"Updated with {chunk_count} document chunks.",
             "processing_time": f"{process_time:.2f} seconds"
         }
     except Exception as e:
@@ -1,92 +1,160 @@
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+import multiprocessing
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
-from PyPDF2 import PdfReader
+import asyncio
+import aiofiles
+import os
+import re
+from typing import Iterator, List, Dict, Any, Optional, Tuple
+import pypdfium2 as pdfium
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+WORD_PATTERN = re.compile(r'\S+')
+
+def _walk(root: Path) -> Iterator[Path]:
+    """Yield every file under root, using the file type cached by os.scandir."""
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield Path(entry.path)
+
+class FileKind(Enum):
+    OTHER = "other"
+    TEXT = "text"
+    PDF = "pdf"
+
 class DocumentProcessor:
+    TEXT_EXTENSIONS = frozenset({'.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.csv', '.xml', '.yaml', '.yml'})
+
     def __init__(self, docs_folder: str = "Documents"):
         """Initialize the document processor."""
         self.docs_folder = Path(docs_folder)
+        # Created on first use and reused across calls, so workers start once per process
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Return the PDF worker pool, creating it on first use."""
+        if self._executor is None:
+            # Spawned rather than forked: the parent already runs encoder and executor
+            # threads, and forking a threaded process can deadlock the child
+            self._executor = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def classify(self, file_path: Path) -> FileKind:
+        """Classify a file as text, PDF or unsupported from its name."""
+        suffix = file_path.suffix.lower()
+        if suffix == '.pdf':
+            return FileKind.PDF
+        if suffix in self.TEXT_EXTENSIONS:
+            name = file_path.name
+            if not name.startswith('.') and name != 'DS_Store':
+                return FileKind.TEXT
+        return FileKind.OTHER
 
     def is_text_file(self, file_path: Path) -> bool:
         """Check if the file is likely a text file."""
-        if file_path.name.startswith('.') or file_path.name == 'DS_Store':
-            return False
-        
-        text_extensions = {'.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.csv', '.xml', '.yaml', '.yml'}
-        return file_path.suffix.lower() in text_extensions
+        return self.classify(file_path) is FileKind.TEXT
 
     def is_pdf_file(self, file_path: Path) -> bool:
         """Check if the file is a PDF file."""
-        return file_path.suffix.lower() == '.pdf'
+        return self.classify(file_path) is FileKind.PDF
 
     def extract_text_from_pdf(self, file_path: Path) -> str:
         """Extract text from a PDF file."""
         try:
             logger.info(f"Processing PDF file: {file_path.name}")
-            reader = PdfReader(str(file_path))
-            text = ""
-            for i, page in enumerate(reader.pages):
-                page_text = page.extract_text() or ""
-                if page_text.strip():
-                    text += f"\nPage {i+1}:\n{page_text}"
+            pdf = pdfium.PdfDocument(str(file_path))
+            parts = []
+            try:
+                for i, page in enumerate(pdf):
+                    textpage = page.get_textpage()
+                    page_text = textpage.get_text_range()
+                    if page_text.strip():
+                        parts.append(f"\nPage {i+1}:\n{page_text}")
+                    textpage.close()
+                    page.close()
+            finally:
+                pdf.close()
             logger.info(f"Successfully extracted text from {file_path.name}")
-            return text
+            return "".join(parts)
         except Exception as e:
             logger.error(f"Error reading PDF {file_path}: {str(e)}")
             return ""
 
+    async def read_text_file(self, file_path: Path) -> str:
+        """Read a text file without blocking the event loop."""
+        try:
+            logger.info(f"Processing text file: {file_path.name}")
+            async with aiofiles.open(file_path, 'r', encoding='utf-8') as file:
+                content = await file.read()
+            logger.info(f"Successfully read text file: {file_path.name}")
+            return content
+        except Exception as e:
+            logger.error(f"Error reading {file_path}: {str(e)}")
+            return ""
+
     def split_text_into_chunks(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
         """Split text into overlapping chunks."""
         if not text.strip():
             return []
             
-        words = text.split()
+        # Word boundaries as character offsets, so each chunk is a single slice of the text
+        spans = [match.span() for match in WORD_PATTERN.finditer(text)]
         chunks = []
-        
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = ' '.join(words[i:i + chunk_size])
-            if chunk.strip():
-                chunks.append(chunk)
-        
+
+        for i in range(0, len(spans), chunk_size - overlap):
+            start = spans[i][0]
+            end = spans[min(i + chunk_size, len(spans)) - 1][1]
+            chunks.append(text[start:end])
+
         return chunks
 
-    def process_documents(self) -> Tuple[List[str], List[Dict[str, Any]]]:
+    async def process_documents(self) -> Tuple[List[str], List[Dict[str, Any]]]:
         """Process all documents and return chunks with metadata."""
         if not self.docs_folder.exists():
             raise FileNotFoundError("Documents folder not found!")
 
+        files = []
+        for file_path in _walk(self.docs_folder):
+            kind = self.classify(file_path)
+            if kind is not FileKind.OTHER:
+                files.append((file_path, kind))
+
         all_chunks = []
         all_metadatas = []
 
-        for file_path in self.docs_folder.glob('**/*'):
-            if file_path.is_file():
-                content = ""
-                if self.is_text_file(file_path):
-                    try:
-                        logger.info(f"Processing text file: {file_path.name}")
-                        with open(file_path, 'r', encoding='utf-8') as file:
-                            content = file.read()
-                        logger.info(f"Successfully read text file: {file_path.name}")
-                    except Exception as e:
-                        logger.error(f"Error reading {file_path}: {str(e)}")
-                elif self.is_pdf_file(file_path):
-                    content = self.extract_text_from_pdf(file_path)
-
-                if content:
-                    chunks = self.split_text_into_chunks(content)
-                    logger.info(f"Created {len(chunks)} chunks from {file_path.name}")
-                    for i, chunk in enumerate(chunks):
-                        all_chunks.append(chunk)
-                        all_metadatas.append({
-                            "filename": file_path.name,
-                            "chunk_index": i,
-                            "total_chunks": len(chunks)
-                        })
+        # Text files are read concurrently on the event loop while PDFs are parsed in
+        # worker processes, since extraction holds the GIL
+        loop = asyncio.get_running_loop()
+        contents = await asyncio.gather(*(
+            loop.run_in_executor(self._get_executor(), _extract_pdf, str(file_path))
+            if kind is FileKind.PDF else self.read_text_file(file_path)
+            for file_path, kind in files
+        ))
+
+        for (file_path, _), content in zip(files, contents):
+            if content:
+                chunks = self.split_text_into_chunks(content)
+                logger.info(f"Created {len(chunks)} chunks from {file_path.name}")
+                for i, chunk in enumerate(chunks):
+                    all_chunks.append(chunk)
+                    all_metadatas.append({
+                        "filename": file_path.name,
+                        "chunk_index": i,
+                        "total_chunks": len(chunks)
+                    })
 
         logger.info(f"Total chunks processed: {len(all_chunks)}")
-        return all_chunks, all_metadatas 
\ No newline at end of file
+        return all_chunks, all_metadatas
+
+def _extract_pdf(path_str: str) -> str:
+    """Extract the text of one PDF; module-level so it can be pickled for worker processes."""
+    return DocumentProcessor().extract_text_from_pdf(Path(path_str))
\ No newline at end of file
@@ -0,0 +1,52 @@
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    # Keep IN (...) lookups under SQLite's bound-parameter limit
+    LOOKUP_BATCH_SIZE = 500
+
+    def __init__(self, path: str = "embedding_cache.db"):
+        """Initialize the SQLite-backed embedding cache."""
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS emb (hash TEXT PRIMARY KEY, model TEXT, vec BLOB)"
+            )
+        logger.info(f"Embedding cache opened at {path}")
+
+    @staticmethod
+    def key(text: str, model: str) -> str:
+        """Return the cache key for a chunk embedded with the given model."""
+        return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+    def get_many(self, texts: List[str], model: str) -> List[Optional[np.ndarray]]:
+        """Look up cached embeddings, returning None for every cache miss."""
+        keys = [self.key(text, model) for text in texts]
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), self.LOOKUP_BATCH_SIZE):
+                batch_keys = keys[i:i + self.LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch_keys))
+                rows = self._conn.execute(
+                    f"SELECT hash, vec FROM emb WHERE hash IN ({placeholders})", batch_keys
+                )
+                for key, vec in rows:
+                    found[key] = np.frombuffer(vec, dtype=np.float32)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, texts: List[str], vectors: np.ndarray, model: str) -> None:
+        """Store embeddings for the given chunks in a single transaction."""
+        rows = [
+            (self.key(text, model), model, np.asarray(vec, dtype=np.float32).tobytes())
+            for text, vec in zip(texts, vectors)
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO emb (hash, model, vec) VALUES (?, ?, ?)", rows)
@@ -1,9 +1,19 @@
+import asyncio
 import json
+import logging
 from dotenv import load_dotenv
+
+# Load environment variables before importing modules that read them
+load_dotenv()
+
 from vector_store import VectorStore
 from document_processor import DocumentProcessor
 from qa_engine import QAEngine
 
+# Configure logging once for the whole process
+if not logging.getLogger().handlers:
+    logging.basicConfig(level=logging.INFO)
+
 def load_projects():
     """Load project information from projects.json."""
     try:
@@ -15,9 +25,6 @@ def load_projects():
 
 def main():
     try:
-        # Load environment variables
-        load_dotenv()
-
         # Initialize components
         vector_store = VectorStore()
         doc_processor = DocumentProcessor()
@@ -29,7 +36,7 @@ def main():
         # Only process and add documents if the collection is empty
         if vector_store.is_empty():
             print("No data in vector store. Processing and adding documents...")
-            chunks, metadatas = doc_processor.process_documents()
+            chunks, metadatas = asyncio.run(doc_processor.process_documents())
             if not chunks:
                 print("No documents found in the Documents folder.")
                 return
@@ -46,7 +53,7 @@ def main():
             if question.lower() == 'update':
                 print("Reprocessing and updating documents...")
                 vector_store.clear()
-                chunks, metadatas = doc_processor.process_documents()
+                chunks, metadatas = asyncio.run(doc_processor.process_documents())
                 vector_store.add_documents(chunks, metadatas)
                 print(f"Updated with {len(chunks)} document chunks.")
                 continue
@@ -62,9 +69,11 @@ def main():
 
             # Include project information if the question is about projects
             if "project" in question.lower():
-                context += "\n\nProject Information:\n"
-                for project in projects_data["projects"]:
-                    context += f"{project['name']}: {project['description']} GitHub: {project['github_link']}\n"
+                project_lines = [
+                    f"{project['name']}: {project['description']} GitHub: {project['github_link']}\n"
+                    for project in projects_data["projects"]
+                ]
+                context = "".join([context, "\n\nProject Information:\n", *project_lines])
 
             answer = qa_engine.get_answer(question, context)
             print("\nAnswer:", answer)
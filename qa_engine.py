@@ -1,39 +1,105 @@
 import os
-from openai import OpenAI
-from typing import Dict, Any
+import httpx
+from openai import AsyncOpenAI, OpenAI
+from functools import lru_cache
+from typing import Dict, Any, AsyncIterator, Tuple
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Read once at import; entry points load .env before importing this module
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+
+# Pooled keep-alive connections, multiplexed over HTTP/2
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+
+# Per-chunk context budget, roughly 1000 tokens
+MAX_CHUNK_BYTES = 4000
+
+def _truncate_chunk(chunk: str) -> str:
+    """Truncate a chunk to the context budget, only encoding it when it could exceed it."""
+    # A character is at most 4 bytes in UTF-8, so short chunks always fit
+    if len(chunk) * 4 <= MAX_CHUNK_BYTES:
+        return chunk
+    encoded = chunk.encode()
+    if len(encoded) <= MAX_CHUNK_BYTES:
+        return chunk
+    return encoded[:MAX_CHUNK_BYTES].decode('utf-8', 'ignore') + "..."
+
+@lru_cache(maxsize=512)
+def _format_context(chunks: Tuple[Tuple[str, int, int, str], ...]) -> str:
+    """Format (filename, chunk_index, total_chunks, text) tuples into a context string."""
+    return "\n\n".join(
+        f"Document: {filename} (part {chunk_index + 1}/{total_chunks})\n{_truncate_chunk(chunk)}"
+        for filename, chunk_index, total_chunks, chunk in chunks
+    )
+
+class AnswerError(str):
+    """Fallback message returned or streamed in place of an answer when the API call fails."""
+
 class QAEngine:
+    # Kept byte-identical across calls so the prompt prefix qualifies for OpenAI prompt caching
+    _SYSTEM_MSG = {
+        "role": "system",
+        "content": "You are a friendly and helpful assistant that answers questions based ONLY on the provided documents. Keep your answers concise and to the point. If the information is not in the documents, say so. If the question is about projects, mention that GitHub links are available for all projects."
+    }
+    TIMEOUT_ANSWER = "The request took too long to process. Please try again with a more specific question."
+    ERROR_PREFIX = "Error getting answer"
+
     def __init__(self, api_key: str = None):
         """Initialize the QA engine."""
-        self.api_key = api_key or os.getenv('OPENAI_API_KEY')
+        self.api_key = api_key or OPENAI_API_KEY
         if not self.api_key:
             raise ValueError("OpenAI API key not found")
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = OpenAI(
+            api_key=self.api_key,
+            http_client=httpx.Client(http2=True, limits=HTTP_LIMITS)
+        )
+        # Used from FastAPI handlers so API calls don't block the event loop
+        self.async_client = AsyncOpenAI(
+            api_key=self.api_key,
+            http_client=httpx.AsyncClient(http2=True, limits=HTTP_LIMITS)
+        )
 
     def prepare_context(self, search_results: Dict[str, Any]) -> str:
         """Prepare context from search results."""
-        if not search_results['documents'] or not search_results['documents'][0]:
+        documents = search_results['documents']
+        if not documents or not documents[0]:
             return ""
+        docs = documents[0]
+        metas = search_results['metadatas'][0]
 
         # Limit context to first 2 most relevant chunks to reduce token usage
         max_chunks = 2
-        context_parts = []
-        
-        for i, chunk in enumerate(search_results['documents'][0][:max_chunks]):
-            if len(chunk) > 1000:  # Limit chunk size
-                chunk = chunk[:1000] + "..."
-            context_parts.append(
-                f"Document: {search_results['metadatas'][0][i]['filename']} "
-                f"(part {search_results['metadatas'][0][i]['chunk_index'] + 1}/"
-                f"{search_results['metadatas'][0][i]['total_chunks']})\n{chunk}"
-            )
-        
-        return "\n\n".join(context_parts)
+        chunks = tuple(
+            (m['filename'], m['chunk_index'], m['total_chunks'], chunk)
+            for chunk, m in zip(docs[:max_chunks], metas[:max_chunks])
+        )
+        # The same top-k chunks always produce the same context, so reuse it
+        return _format_context(chunks)
+
+    def _build_request(self, question: str, context: str) -> Dict[str, Any]:
+        """Build the chat completion arguments for a question and its context."""
+        return {
+            "model": "gpt-3.5-turbo",
+            "messages": [
+                self._SYSTEM_MSG,
+                {
+                    "role": "user",
+                    "content": f"Context:\n{context}\n\nQuestion: {question}"
+                }
+            ],
+            "temperature": 0.5,  # Reduced for more focused responses
+            "max_tokens": 150,   # Reduced for faster responses
+        }
+
+    def _error_answer(self, e: Exception) -> AnswerError:
+        """Log an API error and return the fallback answer for it."""
+        if "timeout" in str(e).lower():
+            logger.error("OpenAI API request timed out")
+            return AnswerError(self.TIMEOUT_ANSWER)
+        logger.error(f"Error getting answer: {str(e)}")
+        return AnswerError(f"{self.ERROR_PREFIX}: {str(e)}")
 
     def get_answer(self, question: str, context: str) -> str:
         """Get answer from OpenAI based on the context."""
@@ -42,27 +108,43 @@ class QAEngine:
 
         try:
             logger.info(f"Making API call for question: {question[:50]}...")
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a friendly and helpful assistant that answers questions based ONLY on the provided documents. Keep your answers concise and to the point. If the information is not in the documents, say so. If the question is about projects, mention that GitHub links are available for all projects."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Context:\n{context}\n\nQuestion: {question}"
-                    }
-                ],
-                temperature=0.5,  # Reduced for more focused responses
-                max_tokens=150,   # Reduced for faster responses
-            )
+            response = self.client.chat.completions.create(**self._build_request(question, context))
             answer = response.choices[0].message.content
             logger.info("Successfully received API response")
             return answer
         except Exception as e:
-            if "timeout" in str(e).lower():
-                logger.error("OpenAI API request timed out")
-                return "The request took too long to process. Please try again with a more specific question."
-            logger.error(f"Error getting answer: {str(e)}")
-            return f"Error getting answer: {str(e)}" 
\ No newline at end of file
+            return self._error_answer(e)
+
+    async def aget_answer(self, question: str, context: str) -> str:
+        """Get answer from OpenAI without blocking the event loop."""
+        if not context:
+            return "No relevant information found in the documents."
+
+        try:
+            logger.info(f"Making API call for question: {question[:50]}...")
+            response = await self.async_client.chat.completions.create(**self._build_request(question, context))
+            answer = response.choices[0].message.content
+            logger.info("Successfully received API response")
+            return answer
+        except Exception as e:
+            return self._error_answer(e)
+
+    async def aget_answer_stream(self, question: str, context: str) -> AsyncIterator[str]:
+        """Stream the answer from OpenAI token by token."""
+        if not context:
+            yield "No relevant information found in the documents."
+            return
+
+        try:
+            logger.info(f"Making streaming API call for question: {question[:50]}...")
+            stream = await self.async_client.chat.completions.create(
+                **self._build_request(question, context),
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            logger.info("Successfully streamed API response")
+        except Exception as e:
+            # Typed so consumers can tell it apart from answer tokens already streamed
+            yield self._error_answer(e)
@@ -0,0 +1,138 @@
+import numpy as np
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional
+import logging
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1024, block_size: int = 1024,
+                 ttl: Optional[float] = None, normalize: bool = True):
+        """Initialize an in-memory cache keyed by embedding similarity.
+
+        Entries older than `ttl` seconds are dropped; None keeps them until evicted.
+        Pass normalize=False when embeddings are already L2-normalized at encode time.
+        A max_entries of 0 or less disables the cache.
+        """
+        self.threshold = threshold
+        self.normalize = normalize
+        self.max_entries = max_entries
+        self.block_size = block_size
+        self.ttl = ttl
+        # Rows [0, size) hold L2-normalized float32 embeddings; the matrix grows in blocks
+        self._embeddings: Optional[np.ndarray] = None
+        self._timestamps: Optional[np.ndarray] = None
+        self._values: List[Any] = []
+        # Row indices in access order, least recently used first
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        # Flat inner-product index over the same rows, ids are row numbers; None without faiss
+        self._index = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def _normalize(self, embedding: np.ndarray) -> np.ndarray:
+        """Return the embedding as an L2-normalized float32 vector."""
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        if not self.normalize:
+            return vector
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _reserve(self, rows: int, dim: int) -> None:
+        """Make sure the embedding matrix has room for at least `rows` rows."""
+        capacity = 0 if self._embeddings is None else self._embeddings.shape[0]
+        if rows <= capacity:
+            return
+        blocks = -(-rows // self.block_size)
+        new_capacity = min(self.max_entries, blocks * self.block_size)
+        matrix = np.empty((new_capacity, dim), dtype=np.float32)
+        timestamps = np.empty(new_capacity, dtype=np.float64)
+        if capacity:
+            matrix[:capacity] = self._embeddings
+            timestamps[:capacity] = self._timestamps
+        self._embeddings = matrix
+        self._timestamps = timestamps
+
+    def _expire(self) -> None:
+        """Drop entries older than the TTL, compacting the remaining rows."""
+        size = len(self._values)
+        if self.ttl is None or size == 0:
+            return
+        expired = time.monotonic() - self._timestamps[:size] > self.ttl
+        if not expired.any():
+            return
+        keep = np.flatnonzero(~expired)
+        remap = {int(old): new for new, old in enumerate(keep)}
+        self._embeddings[:len(keep)] = self._embeddings[keep]
+        self._timestamps[:len(keep)] = self._timestamps[keep]
+        self._values = [self._values[i] for i in keep]
+        self._lru = OrderedDict((remap[row], None) for row in self._lru if row in remap)
+        if self._index is not None:
+            self._index.reset()
+            self._index.add_with_ids(self._embeddings[:len(keep)], np.arange(len(keep), dtype=np.int64))
+        logger.info(f"Semantic cache expired {size - len(keep)} entries")
+
+    def get(self, embedding: np.ndarray) -> Optional[Any]:
+        """Return the cached value for the most similar embedding, if similar enough."""
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            self._expire()
+            size = len(self._values)
+            if size == 0:
+                return None
+            query = self._normalize(embedding)
+            if self._index is not None:
+                scores, rows = self._index.search(query.reshape(1, -1), 1)
+                similarity, row = float(scores[0, 0]), int(rows[0, 0])
+            else:
+                sims = self._embeddings[:size] @ query
+                row = int(np.argmax(sims))
+                similarity = float(sims[row])
+            if similarity < self.threshold:
+                return None
+            self._lru.move_to_end(row)
+            logger.info(f"Semantic cache hit (similarity {similarity:.3f})")
+            return self._values[row]
+
+    def put(self, embedding: np.ndarray, value: Any) -> None:
+        """Cache a value under the given embedding, evicting the LRU entry when full."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._expire()
+            query = self._normalize(embedding)
+            if len(self._values) >= self.max_entries:
+                row, _ = self._lru.popitem(last=False)
+                self._values[row] = value
+            else:
+                row = len(self._values)
+                self._reserve(row + 1, query.shape[0])
+                self._values.append(value)
+            self._embeddings[row] = query
+            self._timestamps[row] = time.monotonic()
+            self._lru[row] = None
+            if faiss is not None:
+                if self._index is None:
+                    self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(query.shape[0]))
+                ids = np.array([row], dtype=np.int64)
+                self._index.remove_ids(ids)
+                self._index.add_with_ids(query.reshape(1, -1), ids)
+
+    def clear(self) -> None:
+        """Drop all cached entries."""
+        with self._lock:
+            self._embeddings = None
+            self._timestamps = None
+            self._values = []
+            self._lru.clear()
+            self._index = None
@@ -1,63 +1,386 @@
+import hashlib
+import os
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+# Let BLAS/OpenMP kernels use every core; must be set before torch and numpy load them
+os.environ.setdefault("OMP_NUM_THREADS", str(os.cpu_count() or 1))
+os.environ.setdefault("MKL_NUM_THREADS", str(os.cpu_count() or 1))
+
+try:
+    import torch
+except ImportError:
+    torch = None
+else:
+    # Follows OMP_NUM_THREADS, so encode workers started with a smaller share keep to it
+    torch.set_num_threads(int(os.environ["OMP_NUM_THREADS"]))
+    try:
+        torch.set_num_interop_threads(2)
+    except RuntimeError:
+        # Only settable before any inter-op parallel work has started in this process
+        pass
+
 import chromadb
+from chromadb.config import Settings
+import numpy as np
 from sentence_transformers import SentenceTransformer
+from embedding_cache import EmbeddingCache
+from semantic_cache import SemanticCache
 import uuid
-from typing import List, Dict, Any
+from typing import Callable, Deque, List, Dict, Any, Optional, Tuple
 import logging
+from collections import OrderedDict, deque
 from functools import lru_cache
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _default_onnx_file() -> str:
+    """Pick the ONNX export of the model that runs fastest on this CPU."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            if "avx512_vnni" in f.read():
+                # Dynamically int8-quantized export, using VNNI dot-product instructions
+                return "onnx/model_qint8_avx512_vnni.onnx"
+    except OSError:
+        pass
+    # Graph-optimized fp32 export; O4 adds fp16 kernels that only help on GPU
+    return "onnx/model_O3.onnx"
+
+def _ort_session_options() -> Optional[Any]:
+    """ONNX Runtime session options using every core, like torch above; None without onnxruntime."""
+    try:
+        import onnxruntime
+    except ImportError:
+        return None
+    options = onnxruntime.SessionOptions()
+    # ORT sizes its own thread pool and ignores torch's settings
+    options.intra_op_num_threads = os.cpu_count() or 1
+    return options
+
+@lru_cache(maxsize=4)
+def _get_st(model_name: str, backend: str, onnx_file_name: str) -> Tuple[SentenceTransformer, str]:
+    """Load an embedding model once per process, returning it with the backend actually used."""
+    if torch is not None and torch.cuda.is_available():
+        # On a GPU the fp16 PyTorch model beats any ONNX export; outputs are widened to fp32 after encoding
+        model = SentenceTransformer(model_name, device="cuda")
+        model.half()
+        return model, "cuda-fp16"
+    if backend != "torch":
+        model_kwargs = None
+        if backend == "onnx":
+            model_kwargs = {"file_name": onnx_file_name, "session_options": _ort_session_options()}
+        try:
+            return SentenceTransformer(model_name, backend=backend, model_kwargs=model_kwargs), backend
+        except Exception as e:
+            logger.warning(f"Could not load {backend} backend, falling back to PyTorch: {str(e)}")
+    return SentenceTransformer(model_name), "torch"
+
+def _content_id(document: str) -> str:
+    """Derive a document id from its content, so re-ingesting it is a no-op."""
+    return hashlib.blake2b(document.encode(), digest_size=16).hexdigest()
+
+# Below this many chunks to encode, starting worker processes costs more than it saves
+MULTI_PROCESS_MIN_DOCS = 4096
+# Encode workers share the cores between them, each with at least two threads
+MULTI_PROCESS_MAX_WORKERS = 4
+# New chunks are encoded this many at a time, length-sorted across the whole span
+ENCODE_SPAN = 8192
+# Chroma's recommended insert size
+INSERT_BATCH_SIZE = 250
+
+# Embeddings are L2-normalized at encode time, so inner product ranks like cosine without
+# re-normalizing on every distance evaluation; larger M/ef trade a little memory for recall
+COLLECTION_METADATA = {
+    "hnsw:space": "ip",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64
+}
+
+# Applied to Chroma's SQLite database to avoid an fsync per inserted document
+SQLITE_PRAGMAS = ("journal_mode=WAL", "synchronous=NORMAL", "temp_store=memory", "cache_size=-262144")
+
 class VectorStore:
-    def __init__(self, collection_name: str = "documents"):
-        """Initialize the vector store with ChromaDB."""
-        self.client = chromadb.Client()
+    def __init__(self, collection_name: str = "documents", client: Optional[Any] = None):
+        """Initialize the vector store with ChromaDB.
+
+        By default the collection is persisted under CHROMA_PATH; pass `client` to use
+        another Chroma client, e.g. an in-memory chromadb.Client().
+        """
+        # On disk, the index survives restarts and memory is bounded by the page cache
+        self.client = client or chromadb.PersistentClient(
+            path=os.getenv("CHROMA_PATH", "./.chroma"),
+            settings=Settings(anonymized_telemetry=False, allow_reset=True)
+        )
+        self._tune_sqlite()
+        # One long-lived writer, so every insert reuses a single tuned SQLite connection;
+        # Chroma keeps one connection per thread and never closes them
+        self._writer = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="chroma-writer",
+            initializer=self._tune_sqlite
+        )
         self.collection_name = collection_name
-        self.sentence_transformer = SentenceTransformer('all-MiniLM-L6-v2')
+        self.model_name = 'all-MiniLM-L6-v2'
+        self.onnx_file_name = os.getenv("EMBEDDING_ONNX_FILE") or _default_onnx_file()
+        # Shared by every VectorStore in the process, so the model is only held in memory once
+        self.sentence_transformer, self.backend = _get_st(
+            self.model_name, os.getenv("EMBEDDING_BACKEND", "onnx"), self.onnx_file_name
+        )
+        # Identifies the exact encoder so cached embeddings from another backend are never reused
+        self.model_id = f"{self.model_name}:{self.backend}"
+        if self.backend == "onnx":
+            self.model_id += f":{self.onnx_file_name}"
+        self.embedding_cache = EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db"))
+        # Memoize query embeddings per instance; bytes keep the cached values small and immutable
+        self._embed_query_cached = lru_cache(maxsize=2048)(self._encode_query)
+        # Search results for semantically equivalent queries, kept for up to a week
+        self._search_cache = SemanticCache(
+            threshold=float(os.getenv("SEARCH_CACHE_THRESHOLD", "0.95")),
+            max_entries=int(os.getenv("SEARCH_CACHE_SIZE", "1024")),
+            ttl=7 * 24 * 3600,
+            normalize=False
+        )
+        # Exact (query, n_results, version) hits; the version is bumped whenever the collection changes
+        self._version = 0
+        self._exact_cache: "OrderedDict[Tuple[str, int, int], Dict[str, Any]]" = OrderedDict()
         
-        # Create collection without embedding function to avoid OpenAI conflicts
+        # Embeddings are always computed here, so Chroma must not load its own embedding model
         self.collection = self.client.get_or_create_collection(
-            name=collection_name
+            name=collection_name,
+            metadata=COLLECTION_METADATA,
+            embedding_function=None
         )
+        # Kept current by add_documents() and clear(); seeded with a one-row probe instead of a full count
+        self._ready = len(self.collection.peek(limit=1)["ids"]) > 0
         logger.info("Vector store initialized")
 
+    def _tune_sqlite(self) -> None:
+        """Apply SQLite PRAGMAs to the calling thread's connection to Chroma's database.
+
+        Chroma keeps one connection per thread and, apart from WAL, these settings are
+        per connection, so every thread that writes must call this. It reaches into Chroma
+        internals that were checked against 0.4.x, so other versions are left untouched.
+        """
+        if not chromadb.__version__.startswith("0.4."):
+            logger.info(f"Skipping SQLite tuning for chromadb {chromadb.__version__}")
+            return
+        try:
+            pool = self.client._server._sysdb._conn_pool
+            conn = pool.connect()
+            try:
+                for pragma in SQLITE_PRAGMAS:
+                    conn.execute(f"PRAGMA {pragma}")
+            finally:
+                pool.return_to_pool(conn)
+            logger.info(f"Applied SQLite pragmas: {', '.join(SQLITE_PRAGMAS)}")
+        except Exception as e:
+            logger.warning(f"Could not tune Chroma SQLite settings: {str(e)}")
+
+    def _encode(self, documents: List[str], pool: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """Encode documents, sharding them across the worker pool when one is given."""
+        if pool is not None:
+            encoded = self.sentence_transformer.encode_multi_process(
+                documents,
+                pool,
+                batch_size=128,
+                normalize_embeddings=True
+            )
+        elif self.backend == "cuda-fp16":
+            # Keep batches on the GPU as tensors and copy to host once, widened to fp32
+            encoded = self.sentence_transformer.encode(
+                documents,
+                batch_size=256,
+                convert_to_tensor=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+            return encoded.float().cpu().numpy()
+        else:
+            encoded = self.sentence_transformer.encode(
+                documents,
+                batch_size=128,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+        return encoded.astype(np.float32)
+
+    def _start_pool(self) -> Optional[Dict[str, Any]]:
+        """Start CPU encode workers that split the cores between them, or None if too few cores."""
+        cores = os.cpu_count() or 1
+        workers = min(MULTI_PROCESS_MAX_WORKERS, cores // 2)
+        if workers < 2:
+            return None
+        # Spawned workers inherit the environment, so each starts with its share of the threads
+        saved = {name: os.environ.get(name) for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS")}
+        os.environ.update({name: str(cores // workers) for name in saved})
+        try:
+            return self.sentence_transformer.start_multi_process_pool(target_devices=["cpu"] * workers)
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+    def _embed_documents(
+        self,
+        documents: List[str],
+        get_pool: Optional[Callable[[], Optional[Dict[str, Any]]]] = None
+    ) -> np.ndarray:
+        """Embed documents, encoding only the chunks missing from the embedding cache.
+
+        get_pool returns the caller's encode worker pool, starting it on first use.
+        """
+        cached = self.embedding_cache.get_many(documents, self.model_id)
+        missing = [i for i, embedding in enumerate(cached) if embedding is None]
+        encoded = None
+        if missing:
+            missing_docs = [documents[i] for i in missing]
+            # Encode in length order so each batch pads only to similar-length chunks,
+            # then scatter the embeddings back to their original positions
+            order = np.argsort([len(doc) for doc in missing_docs])
+            # Workers receive a pickled copy of the model, which only works for the CPU PyTorch
+            # backend; an ONNX Runtime session can't be pickled
+            pool = None
+            if get_pool is not None and len(missing_docs) >= MULTI_PROCESS_MIN_DOCS and self.backend == "torch":
+                pool = get_pool()
+            encoded = self._encode([missing_docs[i] for i in order], pool)[np.argsort(order)]
+            self.embedding_cache.put_many(missing_docs, encoded, self.model_id)
+
+        dim = encoded.shape[1] if encoded is not None else cached[0].shape[0]
+        embeddings = np.empty((len(documents), dim), dtype=np.float32)
+        for i, embedding in enumerate(cached):
+            if embedding is not None:
+                embeddings[i] = embedding
+        if encoded is not None:
+            embeddings[missing] = encoded
+        logger.info(f"Embedding cache: {len(documents) - len(missing)} hits, {len(missing)} misses")
+        return embeddings
+
+    def _upsert(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: np.ndarray
+    ) -> None:
+        """Insert one batch into the collection; runs on the writer thread."""
+        self.collection.upsert(
+            documents=documents,
+            metadatas=metadatas,
+            # Converted to Python floats only at the Chroma boundary
+            embeddings=embeddings.tolist(),
+            ids=ids
+        )
+
     def add_documents(self, documents: List[str], metadatas: List[Dict[str, Any]]) -> None:
-        """Add documents to the vector store."""
+        """Add documents to the vector store, inserting each span while the next is encoded."""
+        # Inserts handed to the writer and not yet checked, oldest first
+        pending: Deque[Future] = deque()
+        # Started on the first span with enough cache misses, then reused for the rest of the call
+        pool_state: Dict[str, Optional[Dict[str, Any]]] = {}
+
+        def get_pool() -> Optional[Dict[str, Any]]:
+            if "pool" not in pool_state:
+                pool_state["pool"] = self._start_pool()
+            return pool_state["pool"]
+
+        skipped = 0
         try:
-            # Generate embeddings manually
-            embeddings = self.sentence_transformer.encode(documents).tolist()
-            
-            # Process documents in smaller batches
-            batch_size = 100
-            for i in range(0, len(documents), batch_size):
-                batch_docs = documents[i:i + batch_size]
-                batch_metas = metadatas[i:i + batch_size]
-                batch_embeddings = embeddings[i:i + batch_size]
-                ids = [str(uuid.uuid4()) for _ in batch_docs]
-                self.collection.add(
-                    documents=batch_docs,
-                    metadatas=batch_metas,
-                    embeddings=batch_embeddings,
-                    ids=ids
-                )
-            logger.info(f"Added {len(documents)} documents to vector store")
+            # Identical chunks share an id; keep the first occurrence of each
+            ids = [_content_id(doc) for doc in documents]
+            seen = set()
+            unique = []
+            for i, doc_id in enumerate(ids):
+                if doc_id not in seen:
+                    seen.add(doc_id)
+                    unique.append(i)
+
+            # Chunks already in the collection are neither re-encoded nor re-inserted
+            new = []
+            for start in range(0, len(unique), INSERT_BATCH_SIZE):
+                batch = unique[start:start + INSERT_BATCH_SIZE]
+                existing = set(self.collection.get(ids=[ids[i] for i in batch], include=[])["ids"])
+                new.extend(i for i in batch if ids[i] not in existing)
+                skipped += len(existing)
+
+            for span_start in range(0, len(new), ENCODE_SPAN):
+                span = new[span_start:span_start + ENCODE_SPAN]
+                span_docs = [documents[i] for i in span]
+                span_embeddings = self._embed_documents(span_docs, get_pool)
+                for start in range(0, len(span), INSERT_BATCH_SIZE):
+                    end = start + INSERT_BATCH_SIZE
+                    pending.append(self._writer.submit(
+                        self._upsert,
+                        [ids[i] for i in span[start:end]],
+                        span_docs[start:end],
+                        [metadatas[i] for i in span[start:end]],
+                        span_embeddings[start:end]
+                    ))
+                    # Bounded to one encoded span waiting in memory for the writer; result()
+                    # also surfaces a failed insert before more work is queued
+                    while len(pending) > ENCODE_SPAN // INSERT_BATCH_SIZE:
+                        pending.popleft().result()
+            for future in pending:
+                future.result()
         except Exception as e:
             logger.error(f"Error adding documents: {str(e)}")
             raise
+        finally:
+            # Never return while inserts handed to the writer are still running
+            wait(pending)
+            if pool_state.get("pool") is not None:
+                self.sentence_transformer.stop_multi_process_pool(pool_state["pool"])
+            # Even a partial insert can change the best matches
+            self._invalidate_results()
+
+        self._ready = self._ready or len(documents) > 0
+        logger.info(f"Added {len(documents)} documents to vector store ({skipped} already present)")
+
+    def _encode_query(self, query: str) -> bytes:
+        """Encode a single query and return the raw float32 bytes."""
+        return self.sentence_transformer.encode([query], normalize_embeddings=True)[0].astype(np.float32).tobytes()
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a single query as an L2-normalized float32 vector, reusing cached results."""
+        return np.frombuffer(self._embed_query_cached(query), dtype=np.float32)
+
+    def _invalidate_results(self) -> None:
+        """Drop cached search results after the collection changes."""
+        self._version += 1
+        self._exact_cache.clear()
+        self._search_cache.clear()
 
-    @lru_cache(maxsize=100)
-    def search(self, query: str, n_results: int = 2) -> Dict[str, Any]:
-        """Search for relevant documents with caching."""
+    def search(self, query: str, n_results: int = 2, query_embedding: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """Search for relevant documents, reusing results for identical or semantically similar queries."""
         try:
             logger.info(f"Searching for query: {query}")
-            # Generate query embedding manually
-            query_embedding = self.sentence_transformer.encode([query]).tolist()[0]
-            
+            # Results computed against an older version of the collection are never stored
+            version = self._version
+            key = (query, n_results, version)
+            if key in self._exact_cache:
+                self._exact_cache.move_to_end(key)
+                return self._exact_cache[key]
+
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
+
+            cached = self._search_cache.get(query_embedding)
+            if cached is not None and cached[0] == n_results:
+                return cached[1]
+
+            # Only documents and metadatas are consumed, so skip fetching distances
             results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results
+                query_embeddings=[query_embedding.tolist()],
+                n_results=n_results,
+                include=["documents", "metadatas"]
             )
+            if version == self._version:
+                self._search_cache.put(query_embedding, (n_results, results))
+                self._exact_cache[key] = results
+                if len(self._exact_cache) > 128:
+                    self._exact_cache.popitem(last=False)
             logger.info(f"Found {len(results['documents'][0])} results")
             return results
         except Exception as e:
@@ -66,31 +389,29 @@ class VectorStore:
 
     def clear(self) -> None:
         """Clear all documents from the collection."""
+        self._ready = False
+        self._invalidate_results()
         try:
             # Delete the existing collection
             self.client.delete_collection(self.collection_name)
             # Create a new empty collection
             self.collection = self.client.create_collection(
-                name=self.collection_name
+                name=self.collection_name,
+                metadata=COLLECTION_METADATA,
+                embedding_function=None
             )
-            # Clear the search cache
-            self.search.cache_clear()
             logger.info("Vector store cleared")
         except Exception as e:
             logger.error(f"Error clearing collection: {str(e)}")
             # If deletion fails, try to create a new collection with a different name
             self.collection_name = f"{self.collection_name}_{uuid.uuid4().hex[:8]}"
             self.collection = self.client.create_collection(
-                name=self.collection_name
+                name=self.collection_name,
+                metadata=COLLECTION_METADATA,
+                embedding_function=None
             )
             logger.info(f"Created new collection: {self.collection_name}")
 
     def is_empty(self) -> bool:
         """Returns True if the collection is empty."""
-        try:
-            count = self.collection.count()
-            logger.info(f"Collection count: {count}")
-            return count == 0
-        except Exception as e:
-            logger.error(f"Error checking collection count: {str(e)}")
-            return True 
\ No newline at end of file
+        return not self._ready
\ No newline at end of file